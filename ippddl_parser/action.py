@@ -1,13 +1,52 @@
 # This file is part of IPPDDL Parser, available at <https://github.com/AndreMoukarzel/ippddl-parser/>.
 
 import random
+import bisect
 import itertools
-from typing import List, Tuple, Dict, Set
+from typing import List, Tuple, Dict, Set, Callable, Optional
 from fractions import Fraction
 
 
+# Every predicate tuple created by the parser is interned here, so identical
+# propositions across actions and states share the same object
+_intern: Dict[tuple, tuple] = {}
+
+
 def frozenset_of_tuples(data):
-    return frozenset([tuple(t) for t in data])
+    setdefault = _intern.setdefault
+    interned = []
+    for t in data:
+        if type(t) is not tuple:
+            t = tuple(t)
+        interned.append(setdefault(t, t))
+    return frozenset(interned)
+
+
+def _apply_effects(state: frozenset, add_effects: frozenset, del_effects: frozenset) -> frozenset:
+    """Returns the state resulting from removing del_effects from and then
+    adding add_effects to state, building a single intermediate set."""
+    if not add_effects and not del_effects: # Outcome changes nothing
+        return state
+    new_state = set(state)
+    new_state.difference_update(del_effects)
+    new_state.update(add_effects)
+    return frozenset(new_state)
+
+
+def propositions_to_bits(propositions, vocab: Dict[tuple, int]) -> int:
+    """Encodes a set of propositions as an int bitmask, where the bit at index
+    vocab[proposition] is set for each proposition. Propositions missing from
+    vocab are added to it with the next free index."""
+    bits = 0
+    for prop in propositions:
+        bits |= 1 << vocab.setdefault(prop, len(vocab))
+    return bits
+
+
+def bits_to_propositions(bits: int, vocab: Dict[tuple, int]) -> frozenset:
+    """Decodes an int bitmask encoded with propositions_to_bits back into a
+    set of propositions."""
+    return frozenset([prop for prop, i in vocab.items() if bits >> i & 1])
 
 
 class Action:
@@ -22,7 +61,8 @@ class Action:
             negative_preconditions: List[List[str]],
             add_effects: List[List[List[str]]],
             del_effects: List[List[List[str]]],
-            probabilities: List[Fraction]=[]
+            probabilities: List[Fraction]=[],
+            exact_probs: bool=False
         ) -> None:
         """Instantiates an Action
 
@@ -49,6 +89,9 @@ class Action:
             Probability of each of the listed add_effects and del_effects pairs
             to occur. If not specified, assumes the action is deterministic and
             therefore all probabilities are 1.0
+        exact_probs: bool, optional
+            If True, imprecise probabilities are settled into Fractions instead
+            of floats. Defaults to False.
         """
         self.name = name
         self.parameters = tuple(parameters)  # Make parameters a tuple so we can hash this if need be
@@ -56,8 +99,28 @@ class Action:
         self.negative_preconditions = frozenset_of_tuples(negative_preconditions)
         self.add_effects = [frozenset_of_tuples(add_effs) for add_effs in add_effects]
         self.del_effects = [frozenset_of_tuples(del_effs) for del_effs in del_effects]
+        # Hash of the fields compared by __eq__, computed once since they don't change
+        self._hash = hash((
+            self.name,
+            tuple([p if isinstance(p, str) else tuple(p) for p in self.parameters]),
+            self.positive_preconditions,
+            self.negative_preconditions,
+            tuple(self.add_effects),
+            tuple(self.del_effects)
+        ))
         self.raw_probabilities = probabilities
         self.probabilities = probabilities
+        self.exact_probs = exact_probs
+        # Latest (signature of groundify's arguments, grounded actions) pair, set by groundify
+        self._ground_cache: Optional[Tuple[tuple, Tuple['Action', ...]]] = None
+        # Whether each outcome's effects are the special "forall" effect of the SysAdmin domain
+        self._add_is_forall = [('sysadmin_forall',) in add_effs for add_effs in self.add_effects]
+        self._del_is_forall = [('sysadmin_forall',) in del_effs for del_effs in self.del_effects]
+        # Generated function that grounds this action's predicates, built by _compile_grounder.
+        # None until compiled, False if the action can't be grounded by a generated function
+        self._grounder = None
+        # Bitmasks of preconditions and effects, set by compile_to_bitset
+        self._bits: Optional[Tuple[int, int, List[int], List[int]]] = None
         if len(probabilities) == 0: # If no probability is specified, assumes action is deterministic
             # Sets all effects to have 100% chance of occuring.
             self.raw_probabilities = [1.0 for _ in add_effects]
@@ -83,7 +146,15 @@ class Action:
         return return_str + '\n'
 
 
+    def __hash__(self) -> int:
+        return self._hash
+
+
     def __eq__(self, other) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, Action) or self._hash != other._hash:
+            return False
         if self.name == other.name and self.parameters == other.parameters \
             and self.positive_preconditions == other.positive_preconditions \
             and self.negative_preconditions == other.negative_preconditions \
@@ -93,7 +164,7 @@ class Action:
         return False
     
 
-    def replace(self, group: frozenset, variables: List[str], assignment: Tuple[str]) -> List[List[str]]:
+    def replace(self, group: frozenset, var_idx: Dict[str, int], assignment: Tuple[str]) -> List[Tuple[str, ...]]:
         """Replaces the variables of predicates specified in group with the
         values specified in assignment.
          
@@ -101,28 +172,22 @@ class Action:
         ----------
         group: frozenset
             Set of predicates.
-        variables: List[str]
-            List of variables present in the predicates from group.
+        var_idx: Dict[str, int]
+            Dictionary mapping each variable present in the predicates from
+            group to the index of its value in assignment.
         assignment: Tuple[str]
             Tuple of values to assign to the variables.
         
         Returns
         -------
-        new_group: List[List[str]]
+        new_group: List[Tuple[str, ...]]
             List with each of the predicates with its variables' values set as
             the assignments, transforming them into propositions.
         """
-        new_group: List[List[str]] = []
-        for pred in group:
-            pred = list(pred)
-            for i, p in enumerate(pred):
-                if p in variables:
-                    pred[i] = assignment[variables.index(p)]
-            new_group.append(pred)
-        return new_group
+        return [tuple([assignment[var_idx[p]] if p in var_idx else p for p in pred]) for pred in group]
 
 
-    def replace_effects(self, effects: List[frozenset], variables: List[str], assignment: Tuple[str], connections: Dict[str, Set[str]]) -> Tuple[List[List[List[str]]], List[float]]:
+    def replace_effects(self, effects: List[frozenset], var_idx: Dict[str, int], assignment: Tuple[str], connections: Dict[str, Set[str]], is_forall: List[bool]=None) -> Tuple[List[List[Tuple[str, ...]]], List[float]]:
         """Replaces the variables of predicates specified in effects with the
         values specified in assignment.
          
@@ -131,41 +196,55 @@ class Action:
         effects: List[frozenset]
             List with all sets of predicates representing the effects of
             possible outcomes of this Action.
-        variables: List[str]
-            List of variables present in the predicates from group.
+        var_idx: Dict[str, int]
+            Dictionary mapping each variable present in the predicates from
+            effects to the index of its value in assignment.
         assignment: Tuple[str]
             Tuple of values to assign to the variables.
         connections: Dict[str, Set[str]]
             Dictionary with connections between computers in a SysAdmin problem.
             Used only with Actions from a SysAdmin problem domain.
+        is_forall: List[bool], optional
+            Whether each element of effects is the special "forall" effect of
+            the SysAdmin domain. Computed from effects if not specified.
         
         Returns
         -------
-        new_effects: List[List[List[str]]]
+        new_effects: List[List[Tuple[str, ...]]]
             List of lists with each of the predicates with its variables' values
             set as the assignments, transforming them into propositions.
         related_probabilities: List[float]
             List of the probabilities of each list of predicates occuring.
         """
-        new_effects: List[List[List[str]]] = []
+        if is_forall is None:
+            is_forall = [('sysadmin_forall',) in eff for eff in effects]
+        if True not in is_forall:
+            return [self.replace(eff, var_idx, assignment) for eff in effects], self.probabilities[:len(effects)]
+
+        new_effects: List[List[Tuple[str, ...]]] = []
         related_probabilities: List[float] = []
         for i, eff in enumerate(effects):
             prob = self.probabilities[i]
-            if ('sysadmin_forall',) in eff: # Special effect of SysAdmin domain
+            if is_forall[i]: # Special effect of SysAdmin domain
                 replaced_eff = []
                 for comp in connections[assignment[0]]:
                     replaced_eff.append(('up', comp))
             else:
-                replaced_eff = self.replace(eff, variables, assignment)
+                replaced_eff = self.replace(eff, var_idx, assignment)
             new_effects.append(replaced_eff)
             related_probabilities.append(prob)
         return new_effects, related_probabilities
 
 
-    def groundify(self, objects: Dict[str, List[str]], types: Dict[str, List[str]], connections: Dict[str, Set[str]]=None):
-        """Applies the given objects and their types to this action, yielding
+    def groundify(self, objects: Dict[str, List[str]], types: Dict[str, List[str]], connections: Dict[str, Set[str]]=None) -> Tuple['Action', ...]:
+        """Applies the given objects and their types to this action, returning
         all possible grounded actions.
 
+        The latest result is memoized, so grounding the same action again with
+        equivalent objects, types, connections and settled probabilities
+        returns the same grounded Action instances. Only one result is kept, so
+        re-settling probabilities does not accumulate old groundings.
+
         Parameters
         ----------
         objects: Dict[str, List[str]]
@@ -178,12 +257,32 @@ class Action:
         connections: Dict[str, Set[str]]
             Dictionary with connections between computers in a SysAdmin problem.
             Used only with Actions from a SysAdmin problem domain.
+
+        Returns
+        -------
+        Tuple[Action, ...]
+            All grounded actions.
         """
         if not self.parameters:
-            yield self
-            return
+            return (self,)
+        key = (
+            tuple((k, tuple(v)) for k, v in sorted(objects.items())),
+            tuple((k, tuple(v)) for k, v in sorted(types.items())),
+            tuple((k, frozenset(v)) for k, v in sorted(connections.items())) if connections else None,
+            tuple(self.probabilities)
+        )
+        if self._ground_cache is not None and self._ground_cache[0] == key:
+            return self._ground_cache[1]
+        grounded = tuple(self._groundify(objects, types, connections))
+        self._ground_cache = (key, grounded)
+        return grounded
+
+
+    def _parameter_domains(self, objects: Dict[str, List[str]], types: Dict[str, List[str]]) -> Tuple[List[List[str]], Dict[str, int]]:
+        """Returns the list of possible values of each of this action's
+        parameters, and a dictionary mapping each parameter to its index."""
         type_map = []
-        variables = []
+        var_idx: Dict[str, int] = {}
         for var, type in self.parameters:
             type_stack = [type]
             items = []
@@ -193,15 +292,136 @@ class Action:
                     items += objects[t]
                 if t in types:
                     type_stack += types[t]
+            var_idx.setdefault(var, len(type_map))
             type_map.append(items)
-            variables.append(var)
+        return type_map, var_idx
+
+
+    def _compile_grounder(self) -> Optional[Callable[[Tuple[str]], tuple]]:
+        """Generates and compiles a function that receives an assignment and
+        returns the grounded positive preconditions, negative preconditions,
+        add effects and del effects of this action, with each variable replaced
+        by an indexed access to the assignment. Assignments are ordered as this
+        action's parameters, as in _parameter_domains.
+
+        Returns None if the action has a SysAdmin "forall" effect, which
+        depends on the problem's connections and must be grounded by
+        replace_effects instead.
+        """
+        if self._grounder is not None:
+            return self._grounder or None
+        if True in self._add_is_forall or True in self._del_is_forall:
+            self._grounder = False
+            return None
+        var_idx: Dict[str, int] = {}
+        for i, (var, _) in enumerate(self.parameters):
+            var_idx.setdefault(var, i)
+
+        def pred_src(pred: tuple) -> str:
+            terms = [f'a[{var_idx[p]}]' if p in var_idx else repr(p) for p in pred]
+            return '(' + ', '.join(terms) + (',)' if len(terms) == 1 else ')')
+
+        def group_src(group: frozenset) -> str:
+            return '[' + ', '.join([pred_src(pred) for pred in group]) + ']'
+
+        src = 'def _ground(a):\n    return (' + ', '.join([
+            group_src(self.positive_preconditions),
+            group_src(self.negative_preconditions),
+            '[' + ', '.join([group_src(add_effs) for add_effs in self.add_effects]) + ']',
+            '[' + ', '.join([group_src(del_effs) for del_effs in self.del_effects]) + ']'
+        ]) + ')\n'
+        namespace = {}
+        exec(compile(src, f'<action {self.name}>', 'exec'), namespace)
+        self._grounder = namespace['_ground']
+        return self._grounder
+
+
+    def _ground_assignment(self, assignment: Tuple[str], var_idx: Dict[str, int], connections: Dict[str, Set[str]]) -> 'Action':
+        """Returns this action grounded with the specified assignment."""
+        grounder = self._compile_grounder()
+        if grounder is not None:
+            return Action(self.name, assignment, *grounder(assignment), self.probabilities[:len(self.add_effects)], self.exact_probs)
+        positive_preconditions = self.replace(self.positive_preconditions, var_idx, assignment)
+        negative_preconditions = self.replace(self.negative_preconditions, var_idx, assignment)
+        add_effects, probs = self.replace_effects(self.add_effects, var_idx, assignment, connections, self._add_is_forall)
+        del_effects, _ = self.replace_effects(self.del_effects, var_idx, assignment, connections, self._del_is_forall)
+        return Action(self.name, assignment, positive_preconditions, negative_preconditions, add_effects, del_effects, probs, self.exact_probs)
+
+
+    def _groundify(self, objects: Dict[str, List[str]], types: Dict[str, List[str]], connections: Dict[str, Set[str]]=None):
+        """Yields all possible grounded actions. See groundify."""
+        type_map, var_idx = self._parameter_domains(objects, types)
+        grounder = self._compile_grounder()
+        if grounder is None:
+            ground = self._ground_assignment
+            for assignment in itertools.product(*type_map):
+                yield ground(assignment, var_idx, connections)
+            return
+        name = self.name
+        probs = self.probabilities
+        num_outcomes = len(self.add_effects)
+        exact_probs = self.exact_probs
         for assignment in itertools.product(*type_map):
-            positive_preconditions = self.replace(self.positive_preconditions, variables, assignment)
-            negative_preconditions = self.replace(self.negative_preconditions, variables, assignment)
-            add_effects, probs = self.replace_effects(self.add_effects, variables, assignment, connections)
-            del_effects, _ = self.replace_effects(self.del_effects, variables, assignment, connections)
-            yield Action(self.name, assignment, positive_preconditions, negative_preconditions, add_effects, del_effects, probs)
-    
+            yield Action(name, assignment, *grounder(assignment), probs[:num_outcomes], exact_probs)
+
+
+    def groundify_for_state(self, objects: Dict[str, List[str]], types: Dict[str, List[str]], state: frozenset, connections: Dict[str, Set[str]]=None):
+        """Yields only the grounded actions applicable in the specified state.
+
+        Parameters are bound one at a time, and a partial assignment is
+        discarded as soon as one of the preconditions whose variables are all
+        bound does not hold in state, skipping every assignment that extends it.
+
+        Parameters
+        ----------
+        objects: Dict[str, List[str]]
+            Dictionary where the keys are the arguments of the un-grounded action
+            and the values are a list of all possible values of such arguments.
+        types: Dict[str, List[str]]
+            Dictionary where the keys are the possible object types and the
+            values are the arguments that belong to such type.
+        state: frozenset
+            State in which the grounded actions must be applicable.
+        connections: Dict[str, Set[str]]
+            Dictionary with connections between computers in a SysAdmin problem.
+            Used only with Actions from a SysAdmin problem domain.
+        """
+        if not self.parameters:
+            if self.is_applicable(state):
+                yield self
+            return
+        type_map, var_idx = self._parameter_domains(objects, types)
+        # Preconditions to be checked at each depth, which is the index of the
+        # last of their variables to be bound (-1 if they have no variables)
+        positive_at: List[List[tuple]] = [[] for _ in range(len(type_map) + 1)]
+        negative_at: List[List[tuple]] = [[] for _ in range(len(type_map) + 1)]
+        for preconditions, at_depth in ((self.positive_preconditions, positive_at), (self.negative_preconditions, negative_at)):
+            for pred in preconditions:
+                depth = max([var_idx[p] for p in pred if p in var_idx], default=-1)
+                at_depth[depth].append(pred)
+        # Preconditions without variables are stored at the last index
+        if not set(positive_at[-1]).issubset(state) or not set(negative_at[-1]).isdisjoint(state):
+            return
+
+        assignment = [None] * len(type_map)
+        num_params = len(type_map)
+        ground = self._ground_assignment
+        replace = self.replace
+
+        def descend(depth: int):
+            if depth == num_params:
+                yield ground(tuple(assignment), var_idx, connections)
+                return
+            positive = positive_at[depth]
+            negative = negative_at[depth]
+            for obj in type_map[depth]:
+                assignment[depth] = obj
+                if all(pred in state for pred in replace(positive, var_idx, assignment)) \
+                    and not any(pred in state for pred in replace(negative, var_idx, assignment)):
+                    yield from descend(depth + 1)
+
+        yield from descend(0)
+
 
     def is_applicable(self, state: frozenset) -> bool:
         """Returns if the action is applicable in the specified state.
@@ -225,7 +445,31 @@ class Action:
         for i, prob in enumerate(self.raw_probabilities):
             if isinstance(prob, tuple):
                 settled_prob: float = random.uniform(prob[0], prob[1])
-                self.probabilities[i] = Fraction(settled_prob)
+                self.probabilities[i] = Fraction(settled_prob) if self.exact_probs else settled_prob
+
+        # Ready-to-apply (add effects, del effects, probability) of each outcome
+        self._outcomes = tuple(zip(self.add_effects, self.del_effects, self.probabilities))
+        # Cumulative probabilities of the outcomes, used to sample one of them
+        self._cum_probs = list(itertools.accumulate(float(prob) for prob in self.probabilities))
+
+
+    def _sample_outcome(self) -> Optional[int]:
+        """Returns the index of an outcome randomly chosen according to the
+        outcomes' probabilities, or None if no outcome occurs.
+
+        As in PPDDL, when the probabilities sum to less than 1 the remaining
+        probability is that of nothing happening. Probabilities summing to more
+        than 1, as the SysAdmin reboot outcomes do, are normalized by their sum.
+        """
+        if not self._cum_probs:
+            return None
+        total = self._cum_probs[-1]
+        randf: float = random.random()
+        if total > 1.0:
+            randf *= total
+        elif randf >= total:
+            return None
+        return bisect.bisect_right(self._cum_probs, randf)
 
 
     def get_possible_resulting_states(self, state: frozenset) -> Tuple[List[frozenset], List[float]]:
@@ -247,16 +491,15 @@ class Action:
         if not self.is_applicable(state):
             return [state], [1.0]
 
+        if len(self._outcomes) == 1:
+            # Deterministic action, skips building the lists in a loop
+            add_effects, del_effects, prob = self._outcomes[0]
+            return [_apply_effects(state, add_effects, del_effects)], [prob]
+
         resulting_states: List[frozenset] = []
         probabilities: List[float] = []
-        for i, prob in enumerate(self.probabilities):
-            add_effects = self.add_effects[i]
-            del_effects = self.del_effects[i]
-            new_state = state.difference(del_effects).union(add_effects)
-            # Sorts propositions to avoid multiple representations of same state
-            new_state = frozenset_of_tuples(sorted(new_state))
-
-            resulting_states.append(new_state)
+        for add_effects, del_effects, prob in self._outcomes:
+            resulting_states.append(_apply_effects(state, add_effects, del_effects))
             probabilities.append(prob)
         return resulting_states, probabilities
     
@@ -266,7 +509,8 @@ class Action:
 
         Randomly chooses, according to the probabilities of each effect
         occuring, one of the possible states reachable by executing this
-        action on the received state.
+        action on the received state. If the probabilities sum to less than 1,
+        the remaining probability is that of the state being left unchanged.
         
         Parameters
         ----------
@@ -280,16 +524,67 @@ class Action:
         """
         if not self.is_applicable(state):
             return state
-        possible_states, probs = self.get_possible_resulting_states(state)
-        randf: float = random.uniform(0.0, 1.0)
-
-        # Sorts possible states from lowest to highest probability
-        states_and_probs = [(poss_state, prob) for poss_state, prob in sorted(zip(possible_states, probs), key=lambda pair: pair[0])]
-        for poss_state, prob in states_and_probs:
-            if randf <= prob:
-                return poss_state
-            randf: float = random.uniform(0.0, 1.0)
-        return state
+        i = self._sample_outcome()
+        if i is None:
+            return state
+        add_effects, del_effects, _ = self._outcomes[i]
+        return _apply_effects(state, add_effects, del_effects)
+
+
+    def compile_to_bitset(self, vocab: Dict[tuple, int]) -> Tuple[int, int, List[int], List[int]]:
+        """Encodes this action's preconditions and effects as int bitmasks
+        over the propositions of vocab, enabling is_applicable_bits and
+        apply_bits. Should only be used with grounded actions.
+
+        Parameters
+        ----------
+        vocab: Dict[tuple, int]
+            Dictionary mapping each proposition to its bit index. Propositions
+            of this action missing from it are added to it.
+
+        Returns
+        -------
+        pos_mask: int
+            Bitmask of the positive preconditions.
+        neg_mask: int
+            Bitmask of the negative preconditions.
+        add_masks: List[int]
+            Bitmask of the add effects of each outcome.
+        del_masks: List[int]
+            Bitmask of the del effects of each outcome.
+        """
+        self._bits = (
+            propositions_to_bits(self.positive_preconditions, vocab),
+            propositions_to_bits(self.negative_preconditions, vocab),
+            [propositions_to_bits(add_effs, vocab) for add_effs in self.add_effects],
+            [propositions_to_bits(del_effs, vocab) for del_effs in self.del_effects]
+        )
+        return self._bits
+
+
+    def is_applicable_bits(self, state: int) -> bool:
+        """Returns if the action is applicable in the specified state, encoded
+        as a bitmask over the vocab given to compile_to_bitset."""
+        if self._bits is None:
+            raise Exception('Action ' + self.name + ' was not compiled with compile_to_bitset')
+        pos_mask, neg_mask, _, _ = self._bits
+        return (state & pos_mask) == pos_mask and not state & neg_mask
+
+
+    def apply_bits(self, state: int) -> int:
+        """Applies the Action to the specified state, encoded as a bitmask over
+        the vocab given to compile_to_bitset, if applicable.
+
+        Randomly chooses one of the outcomes according to their probabilities,
+        leaving the state unchanged with the remaining probability, as in apply.
+        """
+        if not self.is_applicable_bits(state):
+            return state
+        i = self._sample_outcome()
+        if i is None:
+            return state
+        _, _, add_masks, del_masks = self._bits
+        return (state & ~del_masks[i]) | add_masks[i]
 
 
 
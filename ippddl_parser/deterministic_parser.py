@@ -1,16 +1,21 @@
 # This file is part of IPPDDL Parser, available at <https://github.com/AndreMoukarzel/ippddl-parser/>.
 
 import re
+from collections import deque
 
 from .predicate import Predicate
-from .action import Action
+from .action import Action, frozenset_of_tuples, propositions_to_bits
+
+
+_COMMENT_RE = re.compile(r';.*$', re.MULTILINE)
+_TOKEN_RE = re.compile(r'[()]|[^\s()]+')
 
 
 class DeterministicParser:
 
-    SUPPORTED_REQUIREMENTS = [
+    SUPPORTED_REQUIREMENTS = frozenset({
         ':strips', ':negative-preconditions', ':typing', ':equality', ':rewards'
-    ]
+    })
 
 
     def __init__(self, domain_filename=None, problem_filename=None) -> None:
@@ -28,41 +33,44 @@ class DeterministicParser:
     def scan_tokens(self, filename):
         with open(filename) as f:
             # Remove single line comments
-            str = re.sub(r';.*$', '', f.read(), flags=re.MULTILINE).lower()
-        # Tokenize
-        stack = []
-        list = []
-        for t in re.findall(r'[()]|[^\s()]+', str):
+            content = _COMMENT_RE.sub('', f.read()).lower()
+        # Tokenize. The last list in stack is the one currently being filled
+        root = []
+        stack = [root]
+        stack_append = stack.append
+        stack_pop = stack.pop
+        for t in _TOKEN_RE.findall(content):
             if t == '(':
-                stack.append(list)
-                list = []
+                new = []
+                stack[-1].append(new)
+                stack_append(new)
             elif t == ')':
-                if stack:
-                    li = list
-                    list = stack.pop()
-                    list.append(li)
-                else:
+                if len(stack) == 1:
                     raise Exception('Missing open parentheses')
+                stack_pop()
             else:
-                list.append(t)
-        if stack:
+                stack[-1].append(t)
+        if len(stack) != 1:
             raise Exception('Missing close parentheses')
-        if len(list) != 1:
+        if len(root) != 1:
             raise Exception('Malformed expression')
-        return list[0]
+        return root[0]
 
 
     def parse_domain(self, domain_filename, requirements=SUPPORTED_REQUIREMENTS):
-        tokens = self.scan_tokens(domain_filename)
-        if type(tokens) is list and tokens.pop(0) == 'define':
+        tokens = deque(self.scan_tokens(domain_filename))
+        if tokens and tokens.popleft() == 'define':
             self.domain_name = None
             self.requirements = []
             self.types = {}
             self.objects = {}
             self.actions = []
             self.predicates = []
+            # Names of the actions and predicates above, to detect redefinitions
+            self._action_names = set()
+            self._predicate_names = set()
             while tokens:
-                group = tokens.pop(0)
+                group = tokens.popleft()
                 t = group.pop(0)
                 if t == 'domain':
                     self.domain_name = group[0]
@@ -88,6 +96,7 @@ class DeterministicParser:
 
 
     def parse_hierarchy(self, group, structure, name, redefine):
+        group = deque(group)
         list = []
         while group:
             if redefine and group[0] in structure:
@@ -95,14 +104,14 @@ class DeterministicParser:
             elif group[0] == '-':
                 if not list:
                     raise Exception('Unexpected hyphen in ' + name)
-                group.pop(0)
-                type = group.pop(0)
+                group.popleft()
+                type = group.popleft()
                 if type not in structure:
                     structure[type] = []
                 structure[type] += list
                 list = []
             else:
-                list.append(group.pop(0))
+                list.append(group.popleft())
         if list:
             if 'object' not in structure:
                 structure['object'] = []
@@ -119,44 +128,46 @@ class DeterministicParser:
 
     def parse_predicates(self, group):
         for pred in group:
-            predicate_name = pred.pop(0)
-            for predicate in self.predicates:
-                if predicate.name == predicate_name:
-                    raise Exception('Predicate ' + predicate_name + ' redefined')
+            pred = deque(pred)
+            predicate_name = pred.popleft()
+            if predicate_name in self._predicate_names:
+                raise Exception('Predicate ' + predicate_name + ' redefined')
+            self._predicate_names.add(predicate_name)
             arguments = {}
-            untyped_variables = []
+            untyped_variables = deque()
             while pred:
-                t = pred.pop(0)
+                t = pred.popleft()
                 if t == '-':
                     if not untyped_variables:
                         raise Exception('Unexpected hyphen in predicates')
-                    type = pred.pop(0)
+                    type = pred.popleft()
                     while untyped_variables:
-                        arguments[untyped_variables.pop(0)] = type
+                        arguments[untyped_variables.popleft()] = type
                 else:
                     untyped_variables.append(t)
             while untyped_variables:
-                arguments[untyped_variables.pop(0)] = 'object'
+                arguments[untyped_variables.popleft()] = 'object'
             
             predicate = Predicate(predicate_name, arguments)
             self.predicates.append(predicate)
     
 
     def parse_action_parameters(self, unparsed_parameters, action_name):
+        unparsed_parameters = deque(unparsed_parameters)
         parameters = []
-        untyped_parameters = []
+        untyped_parameters = deque()
         while unparsed_parameters:
-            t = unparsed_parameters.pop(0)
+            t = unparsed_parameters.popleft()
             if t == '-':
                 if not untyped_parameters:
                     raise Exception('Unexpected hyphen in ' + action_name + ' parameters')
-                ptype = unparsed_parameters.pop(0)
+                ptype = unparsed_parameters.popleft()
                 while untyped_parameters:
-                    parameters.append([untyped_parameters.pop(0), ptype])
+                    parameters.append([untyped_parameters.popleft(), ptype])
             else:
                 untyped_parameters.append(t)
         while untyped_parameters:
-            parameters.append([untyped_parameters.pop(0), 'object'])
+            parameters.append([untyped_parameters.popleft(), 'object'])
         
         return parameters
 
@@ -180,12 +191,13 @@ class DeterministicParser:
 
 
     def parse_action(self, group):
-        name = group.pop(0)
+        group = deque(group)
+        name = group.popleft()
         if type(name) is not str:
             raise Exception('Action without name definition')
-        for act in self.actions:
-            if act.name == name:
-                raise Exception('Action ' + name + ' redefined')
+        if name in self._action_names:
+            raise Exception('Action ' + name + ' redefined')
+        self._action_names.add(name)
         parameters = []
         positive_preconditions = []
         negative_preconditions = []
@@ -193,20 +205,20 @@ class DeterministicParser:
         add_effects = []
         del_effects = []
         while group:
-            t = group.pop(0)
+            t = group.popleft()
             if t == ':parameters':
-                if type(group) is not list:
+                if not group or type(group[0]) is not list:
                     raise Exception('Error with ' + name + ' parameters')
-                unparsed_parameters = group.pop(0)
+                unparsed_parameters = group.popleft()
                 parameters = self.parse_action_parameters(unparsed_parameters, name)
             elif t == ':precondition':
-                self.split_predicates(group.pop(0), positive_preconditions, negative_preconditions, name, ' preconditions')
+                self.split_predicates(group.popleft(), positive_preconditions, negative_preconditions, name, ' preconditions')
             elif t == ':effect':
-                effects: str = group.pop(0)
+                effects: str = group.popleft()
                 add_effects, del_effects = self.parse_action_effects(effects, name)
             else:
-                group.insert(0, t)
-                extensions.append(group)
+                extensions.append([t, *group])
+                break
         
         action = Action(name, parameters, positive_preconditions, negative_preconditions, add_effects, del_effects)
         self.parse_action_extended(action, extensions)
@@ -222,24 +234,18 @@ class DeterministicParser:
     def add_objects_equality(self, group):
         """Adds equality predicates for all objects in group and returns
         the completed group"""
-        equality_preds = []
-        for objs in self.objects.values():
-            for obj in objs:
-                equality_preds.append(['equal', obj, obj])
-        return group + equality_preds
+        return group + [('equal', obj, obj) for objs in self.objects.values() for obj in objs]
 
 
     def parse_problem(self, problem_filename):
-        def frozenset_of_tuples(data):
-            return frozenset([tuple(t) for t in data])
-        tokens = self.scan_tokens(problem_filename)
-        if type(tokens) is list and tokens.pop(0) == 'define':
+        tokens = deque(self.scan_tokens(problem_filename))
+        if tokens and tokens.popleft() == 'define':
             self.problem_name = None
             self.state = frozenset()
             self.positive_goals = frozenset()
             self.negative_goals = frozenset()
             while tokens:
-                group = tokens.pop(0)
+                group = tokens.popleft()
                 t = group.pop(0)
                 if t == 'problem':
                     self.problem_name = group[0]
@@ -251,7 +257,7 @@ class DeterministicParser:
                 elif t == ':objects':
                     self.parse_objects(group, t)
                 elif t == ':init':
-                    if ':equality' in set(self.requirements):
+                    if ':equality' in self.requirements:
                         group = self.add_objects_equality(group)
                     self.state = frozenset_of_tuples(group)
                 elif t == ':goal':
@@ -261,6 +267,11 @@ class DeterministicParser:
                     self.positive_goals = frozenset_of_tuples(positive_goals)
                     self.negative_goals = frozenset_of_tuples(negative_goals)
                 else: self.parse_problem_extended(t, group)
+            # Bit index of each proposition, for actions compiled with Action.compile_to_bitset
+            self.vocab = {}
+            propositions_to_bits(self.state, self.vocab)
+            propositions_to_bits(self.positive_goals, self.vocab)
+            propositions_to_bits(self.negative_goals, self.vocab)
         else:
             raise Exception('File ' + problem_filename + ' does not match problem pattern')
 
@@ -1,5 +1,6 @@
 # This file is part of IPPDDL Parser, available at <https://github.com/AndreMoukarzel/ippddl-parser/>.
 from fractions import Fraction
+from collections import deque
 
 from .deterministic_parser import DeterministicParser
 from .action import Action
@@ -7,10 +8,10 @@ from .action import Action
 
 class Parser(DeterministicParser):
     
-    SUPPORTED_REQUIREMENTS = DeterministicParser.SUPPORTED_REQUIREMENTS + [
+    SUPPORTED_REQUIREMENTS = DeterministicParser.SUPPORTED_REQUIREMENTS | frozenset({
         ':probabilistic-effects', ':conditional-effects', ':rewards', ':imprecise',
         ':sysadmin'
-    ]
+    })
 
 
     def parse_domain(self, domain_filename, requirements=SUPPORTED_REQUIREMENTS):
@@ -133,12 +134,13 @@ class Parser(DeterministicParser):
     
 
     def parse_action(self, group):
-        name = group.pop(0)
+        group = deque(group)
+        name = group.popleft()
         if type(name) is not str:
             raise Exception('Action without name definition')
-        for act in self.actions:
-            if act.name == name:
-                raise Exception('Action ' + name + ' redefined')
+        if name in self._action_names:
+            raise Exception('Action ' + name + ' redefined')
+        self._action_names.add(name)
         parameters = []
         positive_preconditions = []
         negative_preconditions = []
@@ -147,23 +149,23 @@ class Parser(DeterministicParser):
         del_effects = []
         probs = []
         while group:
-            t = group.pop(0)
+            t = group.popleft()
             if t == ':parameters':
-                if type(group) is not list:
+                if not group or type(group[0]) is not list:
                     raise Exception('Error with ' + name + ' parameters')
-                unparsed_parameters = group.pop(0)
+                unparsed_parameters = group.popleft()
                 parameters = self.parse_action_parameters(unparsed_parameters, name)
             elif t == ':precondition':
-                self.split_predicates(group.pop(0), positive_preconditions, negative_preconditions, name, ' preconditions')
+                self.split_predicates(group.popleft(), positive_preconditions, negative_preconditions, name, ' preconditions')
             elif t == ':effect':
-                effects: str = group.pop(0)
+                effects: str = group.popleft()
                 if not 'sysadmin' in self.domain_name:
                     add_effects, del_effects, probs = self.parse_action_effects(effects, name)
                 else:
                     add_effects, del_effects, probs = self.parse_sysadmin_effects(effects, name)
             else:
-                group.insert(0, t)
-                extensions.append(group)
+                extensions.append([t, *group])
+                break
         
         action = Action(name, parameters, positive_preconditions, negative_preconditions, add_effects, del_effects, probs)
         self.parse_action_extended(action, extensions)
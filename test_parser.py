@@ -1,7 +1,10 @@
 # This file is part of IPPDDL Parser, available at <https://github.com/AndreMoukarzel/ippddl-parser/>.
 
+import random
+import itertools
 import unittest
-from ippddl_parser.action import Action
+from fractions import Fraction
+from ippddl_parser.action import Action, propositions_to_bits, bits_to_propositions
 from ippddl_parser.parser import Parser
 
 
@@ -145,6 +148,120 @@ class TestParser(unittest.TestCase):
         self.assertEqual(neg, [neg_pre[-1]])
 
 
+    def test_groundify_is_memoized(self):
+        parser = Parser()
+        parser.parse_domain('examples/dwr/dwr.pddl')
+        parser.parse_problem('examples/dwr/pb1.pddl')
+        action = parser.actions[0]
+        grounded = action.groundify(parser.objects, parser.types)
+        regrounded = action.groundify(dict(parser.objects), parser.types)
+        self.assertEqual(len(grounded), len(regrounded))
+        self.assertTrue(all(act is reused for act, reused in zip(grounded, regrounded)))
+        objects = {key: list(vals) for key, vals in parser.objects.items()}
+        objects['location'].append('newloc')
+        changed = action.groundify(objects, parser.types)
+        self.assertGreater(len(changed), len(grounded))
+        self.assertTrue(any('newloc' in act.parameters for act in changed))
+
+
+    def test_compiled_grounder(self):
+        parser = Parser()
+        parser.parse_domain('examples/dwr/dwr.pddl')
+        parser.parse_problem('examples/dwr/pb1.pddl')
+        for action in parser.actions:
+            type_map, var_idx = action._parameter_domains(parser.objects, parser.types)
+            grounder = action._compile_grounder()
+            for assignment in itertools.product(*type_map):
+                pos, neg, add, dele = grounder(assignment)
+                self.assertEqual(frozenset(pos), frozenset(action.replace(action.positive_preconditions, var_idx, assignment)))
+                self.assertEqual(frozenset(neg), frozenset(action.replace(action.negative_preconditions, var_idx, assignment)))
+                self.assertEqual([frozenset(eff) for eff in add], [frozenset(eff) for eff in action.replace_effects(action.add_effects, var_idx, assignment, None)[0]])
+                self.assertEqual([frozenset(eff) for eff in dele], [frozenset(eff) for eff in action.replace_effects(action.del_effects, var_idx, assignment, None)[0]])
+            grounded = action.groundify(parser.objects, parser.types)
+            self.assertTrue(all(act.raw_probabilities is not grounded[0].raw_probabilities for act in grounded[1:]))
+
+
+    def test_sysadmin_grounding(self):
+        parser = Parser()
+        parser.parse_domain('examples/sysAdmin/domain.pddl')
+        parser.parse_problem('examples/sysAdmin/p0.pddl')
+        computers = parser.objects['comp']
+        connections = {comp: set(computers) - {comp} for comp in computers}
+        reboot = parser.actions[0]
+        self.assertIsNone(reboot._compile_grounder())
+        self.assertIs(reboot._grounder, False)
+        for act in reboot.groundify(parser.objects, parser.types, connections):
+            self.assertEqual(act.del_effects[-1], frozenset(('up', comp) for comp in connections[act.parameters[0]]))
+
+
+    def test_groundify_for_state(self):
+        parser = Parser()
+        parser.parse_domain('examples/dwr/dwr.pddl')
+        parser.parse_problem('examples/dwr/pb1.pddl')
+        for action in parser.actions:
+            applicable = [act for act in action.groundify(parser.objects, parser.types) if act.is_applicable(parser.state)]
+            self.assertEqual(list(action.groundify_for_state(parser.objects, parser.types, parser.state)), applicable)
+
+
+    def test_bitset_actions(self):
+        parser = Parser()
+        parser.parse_domain('examples/dwr/dwr.pddl')
+        parser.parse_problem('examples/dwr/pb1.pddl')
+        state = parser.state
+        state_bits = propositions_to_bits(state, parser.vocab)
+        for action in parser.actions:
+            for act in action.groundify(parser.objects, parser.types):
+                act.compile_to_bitset(parser.vocab)
+                self.assertEqual(act.is_applicable_bits(state_bits), act.is_applicable(state))
+                self.assertEqual(bits_to_propositions(act.apply_bits(state_bits), parser.vocab), act.apply(state))
+
+
+    def test_bitset_apply_leftover_probability(self):
+        vocab = {}
+        action = Action('fail', [], [], [], [[['done']]], [[]], [0.0])
+        self.assertRaises(Exception, action.apply_bits, 0)
+        action.compile_to_bitset(vocab)
+        for _ in range(20):
+            self.assertEqual(action.apply_bits(0), 0)
+
+
+    def test_apply_samples_outcomes(self):
+        random.seed(0)
+        action = Action('flip', [], [], [], [[['heads']], [['tails']]], [[], []], [0.0, 1.0])
+        for _ in range(20):
+            self.assertEqual(action.apply(frozenset()), frozenset([('tails',)]))
+        # Outcomes summing to 1 always change the state, even when none of
+        # them is individually likely
+        action = Action('flip', [], [], [], [[['heads']], [['tails']]], [[], []], [0.5, 0.5])
+        results = [action.apply(frozenset()) for _ in range(200)]
+        self.assertNotIn(frozenset(), results)
+        self.assertIn(frozenset([('heads',)]), results)
+        self.assertIn(frozenset([('tails',)]), results)
+
+
+    def test_apply_leftover_probability(self):
+        random.seed(0)
+        # Leftover probability is that of nothing happening
+        action = Action('fail', [], [], [], [[['done']]], [[]], [0.0])
+        for _ in range(20):
+            self.assertEqual(action.apply(frozenset()), frozenset())
+        action = Action('try', [], [], [], [[['done']]], [[]], [Fraction(3, 4)])
+        successes = sum(action.apply(frozenset()) == frozenset([('done',)]) for _ in range(2000))
+        self.assertTrue(1400 < successes < 1600)
+
+
+    def test_action_hash(self):
+        parser = Parser()
+        parser.parse_domain('examples/dinner/dinner.pddl')
+        copies = [
+            Action('cook', [], [['clean']], [], [[['dinner']]], [[]]),
+            Action('cook', [], [['clean']], [], [[['dinner']]], [[]])
+        ]
+        self.assertEqual(len(set(copies)), 1)
+        self.assertEqual(hash(copies[0]), hash(parser.actions[0]))
+        self.assertEqual(len(set(parser.actions + copies)), len(parser.actions))
+
+
 
 if __name__ == '__main__':
     unittest.main()